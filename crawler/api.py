@@ -1,17 +1,28 @@
 # File: crawler/api.py
 import os
-import json
-import sqlite3
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import Optional
 from datetime import datetime
 
-import typesense
+import httpx
+import numpy as np
+import orjson
+import aiosqlite
+import redis.asyncio as redis
+from aiosqlitepool import SQLiteConnectionPool
 from fastapi import FastAPI, HTTPException, Query, Request, Response
-from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from fastapi.responses import ORJSONResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
 from dotenv import load_dotenv
 
+from crawler.db import SQLITE_PRAGMAS
+from crawler.embed import load_embedder
+
 load_dotenv()
 
 # Typesense configuration
@@ -23,18 +34,135 @@ TS_API_KEY = os.getenv("TYPESENSE_API_KEY", "")
 # FastAPI configuration
 FASTAPI_HOST = os.getenv("FASTAPI_HOST", "0.0.0.0")
 FASTAPI_PORT = int(os.getenv("FASTAPI_PORT", "8000"))
+# inference threads per process; 0 = library default, gunicorn.conf.py sets 1
+EMBED_THREADS = int(os.getenv("EMBED_NUM_THREADS", "0"))
+# dynamic batching of query embeddings
+EMBED_BATCH_SIZE   = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")) / 1000
+EMBED_CACHE_SIZE   = 4096
+# how long a request waits for its embedding before giving up with a 503
+EMBED_TIMEOUT      = float(os.getenv("EMBED_TIMEOUT_S", "5"))
+
+# Async Typesense HTTP client (keep-alive connections shared across requests)
+_http = httpx.AsyncClient(
+    base_url=f"{TS_PROTO}://{TS_HOST}:{TS_PORT}",
+    headers={"X-TYPESENSE-API-KEY": TS_API_KEY},
+    timeout=2,
+)
+
+async def ts_get(path: str, params: Optional[dict] = None) -> dict:
+    resp = await _http.get(path, params=params)
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
+
+# Search result cache (disabled when REDIS_URL is unset)
+REDIS_URL      = os.getenv("REDIS_URL", "")
+CACHE_TTL      = int(os.getenv("SEARCH_CACHE_TTL", "120"))
+CACHE_TTL_USER = int(os.getenv("SEARCH_CACHE_TTL_USER", "30"))
+redis_client = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+
+# Embedding model (int8 ONNX if exported, else SentenceTransformer)
+embed_model = load_embedder(num_threads=EMBED_THREADS)
+
+_embed_queue: asyncio.Queue = asyncio.Queue()
+# LRU of normalized query -> vector; tuples so callers can't mutate the cache
+_embed_cache: OrderedDict[str, tuple] = OrderedDict()
+# queries queued or being encoded; concurrent misses for the same text share one
+_embed_inflight: dict[str, asyncio.Future] = {}
+
+async def _embed_batch_worker():
+    # gather queries arriving within a short window and encode them together
+    while True:
+        items = [await _embed_queue.get()]
+        await asyncio.sleep(EMBED_BATCH_WINDOW)
+        while not _embed_queue.empty() and len(items) < EMBED_BATCH_SIZE:
+            items.append(_embed_queue.get_nowait())
+        try:
+            # CPU-bound: run in a thread so the event loop keeps serving
+            vecs = await asyncio.to_thread(
+                embed_model.encode,
+                [text for text, _ in items],
+                batch_size=EMBED_BATCH_SIZE,
+                normalize_embeddings=True,
+            )
+        except Exception as e:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        for (_, fut), vec in zip(items, vecs):
+            if not fut.done():
+                fut.set_result(tuple(vec.tolist()))
+
+async def embed_query(q: str) -> tuple:
+    if q in _embed_cache:
+        _embed_cache.move_to_end(q)
+        return _embed_cache[q]
+    fut = _embed_inflight.get(q)
+    if fut is None:
+        fut = asyncio.get_running_loop().create_future()
+        _embed_inflight[q] = fut
+        fut.add_done_callback(lambda _: _embed_inflight.pop(q, None))
+        _embed_queue.put_nowait((q, fut))
+    try:
+        # shield: one caller timing out must not cancel the shared future
+        vec = await asyncio.wait_for(asyncio.shield(fut), EMBED_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Embedding timed out")
+    _embed_cache[q] = vec
+    if len(_embed_cache) > EMBED_CACHE_SIZE:
+        _embed_cache.popitem(last=False)
+    return vec
 
-# Initialize Typesense client
-ts_client = typesense.Client({
-    "nodes": [{"host": TS_HOST, "port": TS_PORT, "protocol": TS_PROTO}],
-    "api_key": TS_API_KEY,
-    "connection_timeout_seconds": 2
-})
-# Embedding model
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
+# User profile SQLite DB
+DB_PATH = os.getenv('USER_PROFILE_DB', 'user_profiles.db')
+
+async def _connect() -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(DB_PATH)
+    for pragma in SQLITE_PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+pool = SQLiteConnectionPool(_connect)
+
+def _load_vec(raw) -> np.ndarray:
+    # interest is raw float32 bytes; rows written before that hold a JSON list
+    if isinstance(raw, str):
+        return np.asarray(orjson.loads(raw), dtype=np.float32)
+    return np.frombuffer(raw, dtype=np.float32)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with pool.connection() as conn:
+        await conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS user_profile (
+              user_id TEXT PRIMARY KEY,
+              interest BLOB,
+              cnt INTEGER,
+              updated_at TEXT
+            )
+            '''
+        )
+        await conn.commit()
+    embed_worker = asyncio.create_task(_embed_batch_worker())
+    try:
+        yield
+    finally:
+        embed_worker.cancel()
+        await pool.close()
+        await _http.aclose()
+        if redis_client is not None:
+            await redis_client.aclose()
 
 # Initialize FastAPI
-app = FastAPI(title="News Search API", version="0.3.0")
+# Typesense results are returned as-is, serialized by orjson without model validation
+app = FastAPI(
+    title="News Search API",
+    version="0.3.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 # Metrics
 REQUEST_COUNT = Counter(
@@ -43,29 +171,35 @@ REQUEST_COUNT = Counter(
 REQUEST_LATENCY = Histogram(
     'api_request_latency_seconds', 'API request latency', ['endpoint']
 )
-
-# User profile SQLite DB
-DB_PATH = os.getenv('USER_PROFILE_DB', 'user_profiles.db')
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-conn.execute(
-    '''
-    CREATE TABLE IF NOT EXISTS user_profile (
-      user_id TEXT PRIMARY KEY,
-      interest TEXT,
-      cnt INTEGER,
-      updated_at TEXT
-    )
-    '''
+CACHE_COUNT = Counter(
+    'api_cache_count', 'Search cache lookups', ['endpoint', 'result']
 )
-conn.commit()
 
-class SearchResponse(BaseModel):
-    found: int
-    hits: list
-    page: int
-    request_params: dict
-    search_time_ms: int
-    cursor: Optional[str] = None
+def cache_key(endpoint: str, params: dict) -> str:
+    digest = hashlib.blake2b(
+        orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=16
+    ).hexdigest()
+    return f"{endpoint}:{digest}"
+
+async def cache_get(key: str) -> Optional[dict]:
+    if redis_client is None:
+        return None
+    try:
+        cached = await redis_client.get(key)
+    except redis.RedisError:
+        # a cache outage must not take search down with it
+        return None
+    endpoint = key.split(":", 1)[0]
+    CACHE_COUNT.labels(endpoint=endpoint, result="hit" if cached else "miss").inc()
+    return orjson.loads(cached) if cached else None
+
+async def cache_set(key: str, value: dict, ttl: int):
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, ttl, orjson.dumps(value))
+    except redis.RedisError:
+        pass
 
 # Middleware for metrics
 @app.middleware("http")
@@ -80,62 +214,123 @@ async def metrics_middleware(request: Request, call_next):
 
 @app.get("/metrics")
 def metrics():
-    data = generate_latest()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # aggregate the samples written by every gunicorn worker
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        data = generate_latest(registry)
+    else:
+        data = generate_latest()
     return Response(content=data, media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/health")
-def health():
+async def health():
     try:
-        status = ts_client.health.retrieve()
+        status = await ts_get("/health")
         return {"typesense": status}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Typesense error: {e}")
 
 @app.post("/click/{user_id}/{doc_id}")
-def click(user_id: str, doc_id: str):
+async def click(user_id: str, doc_id: str):
     # retrieve document vector from Typesense
     try:
-        doc = ts_client.collections['news'].documents[doc_id].retrieve()
+        doc = await ts_get(f"/collections/news/documents/{doc_id}")
     except Exception:
         raise HTTPException(status_code=404, detail="Document not found")
-    vec = doc.get('vec')
-    if not vec:
+    if not doc.get('vec'):
         raise HTTPException(status_code=500, detail="Vector missing in document")
+    vec = np.asarray(doc['vec'], dtype=np.float32)
 
-    cur = conn.cursor()
-    cur.execute("SELECT interest, cnt FROM user_profile WHERE user_id = ?", (user_id,))
-    row = cur.fetchone()
-    if row:
-        old_interest, cnt = row
-        old_vec = json.loads(old_interest)
-        cnt += 1
-        # incremental average
-        new_vec = [(o*(cnt-1) + v)/cnt for o, v in zip(old_vec, vec)]
-        cur.execute(
-            "UPDATE user_profile SET interest = ?, cnt = ?, updated_at = ? WHERE user_id = ?",
-            (json.dumps(new_vec), cnt, datetime.utcnow().isoformat()+'Z', user_id)
-        )
-    else:
-        # first click
-        cur.execute(
-            "INSERT INTO user_profile (user_id, interest, cnt, updated_at) VALUES (?, ?, ?, ?)",
-            (user_id, json.dumps(vec), 1, datetime.utcnow().isoformat()+'Z')
-        )
-    conn.commit()
+    async with pool.connection() as conn:
+        # take the write lock before reading so concurrent clicks by the
+        # same user can't interleave and lose an update
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            async with conn.execute(
+                "SELECT interest, cnt FROM user_profile WHERE user_id = ?", (user_id,)
+            ) as cur:
+                row = await cur.fetchone()
+            if row:
+                old_interest, cnt = row
+                old_vec = _load_vec(old_interest)
+                cnt += 1
+                # incremental average
+                new_vec = (old_vec*(cnt-1) + vec) / cnt
+                await conn.execute(
+                    "UPDATE user_profile SET interest = ?, cnt = ?, updated_at = ? WHERE user_id = ?",
+                    (new_vec.tobytes(), cnt, datetime.utcnow().isoformat()+'Z', user_id)
+                )
+            else:
+                # first click
+                await conn.execute(
+                    "INSERT INTO user_profile (user_id, interest, cnt, updated_at) VALUES (?, ?, ?, ?)",
+                    (user_id, vec.tobytes(), 1, datetime.utcnow().isoformat()+'Z')
+                )
+            await conn.commit()
+        except Exception:
+            # don't hand a connection with an open transaction back to the pool
+            await conn.rollback()
+            raise
     return {"status": "ok"}
 
-@app.get("/search", response_model=SearchResponse)
-def search(
+# personalized ranking blend
+RANK_WEIGHT = 0.8
+USER_WEIGHT = 0.2
+
+def rerank(hits: list, user_vec: np.ndarray) -> list:
+    # score every hit against the user vector locally (one GEMV) instead of
+    # a second ANN search; further signals (recency, CTR) add more terms here
+    if not hits:
+        return hits
+    zero = np.zeros_like(user_vec)
+    M = np.stack([
+        np.asarray(hit['document'].pop('vec', None) or zero, dtype=np.float32)
+        for hit in hits
+    ])
+    hit_scores = np.fromiter(
+        (hit.get('_ranking_score', 0.0) for hit in hits), dtype=np.float32, count=len(hits)
+    )
+    # weighted sum
+    combined = RANK_WEIGHT*hit_scores + USER_WEIGHT*(M @ user_vec)
+    ranked = []
+    for i in np.argsort(-combined, kind="stable"):
+        hit = hits[i]
+        hit['score'] = float(combined[i])
+        ranked.append(hit)
+    return ranked
+
+@app.get("/search")
+async def search(
     q: str = Query(...),
     limit: int = Query(10, ge=1, le=100),
     cursor: Optional[str] = Query(None),
     semantic: bool = Query(False),
     user_id: Optional[str] = Query(None)
 ):
-    # base search
+    key = cache_key("search", {
+        "q": q, "limit": limit, "cursor": cursor,
+        "semantic": semantic, "user_id": user_id,
+    })
+    cached = await cache_get(key)
+    if cached is not None:
+        return cached
+
     try:
+        # personalization profile (decides whether hits need their `vec`)
+        user_vec = None
+        if user_id:
+            async with pool.connection() as conn:
+                async with conn.execute(
+                    "SELECT interest FROM user_profile WHERE user_id = ?", (user_id,)
+                ) as cur:
+                    row = await cur.fetchone()
+            if row:
+                user_vec = _load_vec(row[0])
+
+        # base search
         if semantic:
-            q_vec = embed_model.encode(q, normalize_embeddings=True).tolist()
+            q_vec = await embed_query(" ".join(q.lower().split()))
             params = {
                 "q": "*",
                 "query_by": "title",
@@ -150,45 +345,42 @@ def search(
             }
             if cursor:
                 params["cursor"] = cursor
+        if user_vec is None:
+            # the 384-float vector is ~4KB per hit and clients never need it
+            params["exclude_fields"] = "vec"
 
-        ts_result = ts_client.collections["news"].documents.search(params)
+        ts_result = await ts_get("/collections/news/documents/search", params)
         hits = ts_result['hits']
 
         # personalization
-        if user_id:
-            cur = conn.cursor()
-            cur.execute("SELECT interest FROM user_profile WHERE user_id = ?", (user_id,))
-            row = cur.fetchone()
-            if row:
-                user_vec = json.loads(row[0])
-                # vector search for user preference
-                uv_param = {
-                    "q": "*",
-                    "query_by": "title",
-                    "vector_query": f"vec:([{','.join(map(str, user_vec))}], k:{limit})"
-                }
-                uv_res = ts_client.collections["news"].documents.search(uv_param)
-                user_scores = {r['document']['id']: r['vector_score'] for r in uv_res['hits']}
-                # merge scores
-                for hit in hits:
-                    doc_id = hit['document']['id']
-                    hit_score = hit['_ranking_score'] if '_ranking_score' in hit else 0
-                    user_score = user_scores.get(doc_id, 0)
-                    # weighted sum
-                    hit['score'] = 0.8*hit_score + 0.2*user_score
-                # sort hits
-                hits.sort(key=lambda x: x['score'], reverse=True)
-                ts_result['hits'] = hits
+        if user_vec is not None:
+            ts_result['hits'] = rerank(hits, user_vec)
+        # personalized results go stale faster as the profile changes
+        await cache_set(key, ts_result, CACHE_TTL_USER if user_id else CACHE_TTL)
         return ts_result
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 '''
+poetry add httpx aiosqlite aiosqlitepool redis orjson numpy gunicorn
+
 .env
+REDIS_URL=redis://redis:6379/0
+SEARCH_CACHE_TTL=120
+SEARCH_CACHE_TTL_USER=30
 FASTAPI_HOST=0.0.0.0
 FASTAPI_PORT=8000
+API_WORKERS=4
+EMBED_BATCH_SIZE=32
+EMBED_BATCH_WINDOW_MS=5
+EMBED_TIMEOUT_S=5
+
+# PROMETHEUS_MULTIPROC_DIR must be in the real environment (see README),
+# not .env: prometheus_client reads it at import time, before load_dotenv()
 
 docker-compose up -d api
 curl http://localhost:8000/health
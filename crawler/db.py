@@ -0,0 +1,15 @@
+# Shared SQLite connection settings for user_profiles.db and raw_pages.db
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers don't block the writer
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",     # wait instead of failing with 'database is locked'
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",     # 64 MiB page cache
+)
+
+
+def apply_pragmas(conn):
+    # for plain sqlite3 connections; async callers iterate SQLITE_PRAGMAS
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
@@ -0,0 +1,133 @@
+import os
+import argparse
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+# load environment variables from .env
+load_dotenv()
+
+# Configuration
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_DIR   = Path(os.getenv("EMBED_ONNX_DIR", "models/all-MiniLM-L6-v2-int8"))
+ONNX_FILE  = "model_quantized.onnx"
+EMBED_DIM  = 384
+MAX_LENGTH = 256  # same max_seq_length as the sentence-transformers model
+
+
+class OnnxEmbedder:
+    """
+    Drop-in replacement for SentenceTransformer.encode backed by an
+    int8-quantized ONNX export: tokenize, run the session, mean-pool over
+    the attention mask and optionally L2-normalize.
+    """
+
+    def __init__(self, model_dir: Path, max_seq_length: int = MAX_LENGTH, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir), use_fast=True)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            opts.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(model_dir / ONNX_FILE), opts, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        # same attribute name as SentenceTransformer so callers can adjust either
+        self.max_seq_length = max_seq_length
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        enc = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+        token_emb = self.session.run(None, feed)[0]
+        # mean pooling over real (non-padding) tokens
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        return (token_emb * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences,
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+    ) -> np.ndarray:
+        # convert_to_numpy / show_progress_bar are accepted for API parity only
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, EMBED_DIM), dtype=np.float32)
+
+        vecs = np.concatenate([
+            self._encode_batch(texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]).astype(np.float32)
+        if normalize_embeddings:
+            vecs /= np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+        return vecs[0] if single else vecs
+
+
+def load_embedder(num_threads: int = 0):
+    # prefer the quantized ONNX export; fall back to the FP32 torch model.
+    # num_threads > 0 caps intra-op threads so N worker processes don't
+    # each spawn one thread per core and oversubscribe the CPU.
+    if (ONNX_DIR / ONNX_FILE).exists():
+        return OnnxEmbedder(ONNX_DIR, num_threads=num_threads)
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+
+def export(model_dir: Path):
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+    model.save_pretrained(model_dir)
+    AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(model_dir)
+
+    # dynamic int8 quantization (weights int8, activations quantized at runtime)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+    print(f"Quantized model written to {model_dir / ONNX_FILE}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Export the embedder to int8 ONNX")
+    p.add_argument(
+        "--out",
+        type=Path,
+        default=ONNX_DIR,
+        help="directory to write the quantized model into",
+    )
+    args = p.parse_args()
+    export(args.out)
+
+
+if __name__ == "__main__":
+    main()
+
+
+'''
+Example usage:
+poetry add onnxruntime "optimum[onnxruntime]" transformers
+
+.env
+EMBED_ONNX_DIR=models/all-MiniLM-L6-v2-int8
+
+bash command (one-time export):
+poetry run python -m crawler.embed --out models/all-MiniLM-L6-v2-int8
+'''
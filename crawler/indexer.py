@@ -3,15 +3,19 @@
 import os
 import sys
 import time
-import json
 from pathlib import Path
 from datetime import datetime
 
+import httpx
+import numpy as np
+import orjson
 import typesense
 import motor.motor_asyncio
 import asyncio
+import redis.asyncio as redis
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
+
+from crawler.embed import load_embedder
 
 load_dotenv()
 
@@ -23,9 +27,10 @@ TYPESENSE_PROTO  = os.getenv("TYPESENSE_PROTOCOL", "http")
 TYPESENSE_KEY    = os.getenv("TYPESENSE_API_KEY", "")
 LAST_INDEXED     = Path(os.getenv("LAST_INDEXED_FILE", ".last_indexed"))
 POLL_INTERVAL    = int(os.getenv("INDEXER_INTERVAL", "60"))  # seconds
+REDIS_URL        = os.getenv("REDIS_URL", "")  # API search cache to invalidate
 
-# Load embedder
-EMBED_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+# Load embedder (int8 ONNX if exported, else SentenceTransformer)
+EMBED_MODEL = load_embedder()
 
 # Typesense collection schema with `vec`
 COLLECTION_SCHEMA = {
@@ -57,6 +62,65 @@ def iso_to_epoch(ts: str) -> int:
     return int(dt.timestamp())
 
 
+def embed_texts(texts: list[str]) -> np.ndarray:
+    # sort by length so each mini-batch pads only to neighbours of similar
+    # length (the ONNX embedder doesn't sort internally), then unsort
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vecs = EMBED_MODEL.encode(
+        [texts[i] for i in order],
+        batch_size=64,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    out = np.empty_like(vecs)
+    out[order] = vecs
+    return out
+
+
+def _ndjson_iter(docs: list[dict]):
+    # numpy rows serialize directly, no .tolist() round-trip
+    for d in docs:
+        yield orjson.dumps(d, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+
+def index_batch(ts_http: httpx.Client, docs_to_index: list[dict], texts: list[str]):
+    for d, vec in zip(docs_to_index, embed_texts(texts)):
+        d["vec"] = vec
+    # stream the NDJSON body (chunked) instead of building it in memory
+    resp = ts_http.post(
+        "/collections/news/documents/import",
+        params={"action": "upsert"},
+        content=_ndjson_iter(docs_to_index),
+        headers={"Content-Type": "text/plain"},
+    )
+    resp.raise_for_status()
+
+    # Typesense answers 200 with one {"success": ...} line per document;
+    # a rejected line is a validation error that will fail the same way on
+    # every retry, so log it rather than holding back the checkpoint
+    for d, line in zip(docs_to_index, resp.content.splitlines()):
+        result = orjson.loads(line)
+        if not result.get("success"):
+            print(f"Typesense rejected {d['id']}: {result.get('error')}", file=sys.stderr)
+
+
+async def invalidate_search_cache():
+    # drop cached /search results once per indexing burst
+    if not REDIS_URL:
+        return
+    r = redis.Redis.from_url(REDIS_URL)
+    try:
+        keys = [k async for k in r.scan_iter(match="search:*", count=1000)]
+        for i in range(0, len(keys), 500):
+            await r.unlink(*keys[i:i + 500])
+    except redis.RedisError as e:
+        # the cache is optional; stale entries expire on their own TTL
+        print(f"search cache invalidation failed: {e}", file=sys.stderr)
+    finally:
+        await r.aclose()
+
+
 async def run_indexer():
     # Mongo client
     m_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
@@ -85,38 +149,54 @@ async def run_indexer():
     cursor = col.find(query).sort("updated", 1)
 
     docs_to_index = []
+    texts = []
+    batch_ts = []
     new_last_ts = last_ts
-
-    async for doc in cursor:
-        ts_doc = {
-            "id": str(doc["_id"]),
-            "title": doc.get("title", ""),
-            "body": doc.get("body", ""),
-            "source": doc.get("source", ""),
-            "tags": doc.get("tags", []),
-            "published_at": iso_to_epoch(doc.get("published_at"))
-                if doc.get("published_at") else 0
-        }
-        # compute embedding
-        text = ts_doc["title"] + "\n" + ts_doc["body"]
-        vec = EMBED_MODEL.encode(text, normalize_embeddings=True).tolist()
-        ts_doc["vec"] = vec
-
-        docs_to_index.append(ts_doc)
-        new_last_ts = doc["updated"]
-
-        if len(docs_to_index) >= 500:
-            payload = "\n".join(json.dumps(d) for d in docs_to_index)
-            ts_client.collections["news"].documents.import_(payload, {"action": "upsert"})
-            docs_to_index = []
-
-    if docs_to_index:
-        payload = "\n".join(json.dumps(d) for d in docs_to_index)
-        ts_client.collections["news"].documents.import_(payload, {"action": "upsert"})
+    indexed = False
+
+    # Plain HTTP client for streamed document imports
+    with httpx.Client(
+        base_url=f"{TYPESENSE_PROTO}://{TYPESENSE_HOST}:{TYPESENSE_PORT}",
+        headers={"X-TYPESENSE-API-KEY": TYPESENSE_KEY},
+        timeout=60,
+    ) as ts_http:
+        async for doc in cursor:
+            ts_doc = {
+                "id": str(doc["_id"]),
+                "title": doc.get("title", ""),
+                "body": doc.get("body", ""),
+                "source": doc.get("source", ""),
+                "tags": doc.get("tags", []),
+                "published_at": iso_to_epoch(doc.get("published_at"))
+                    if doc.get("published_at") else 0
+            }
+            # embeddings are computed per batch in index_batch
+            texts.append(ts_doc["title"] + "\n" + ts_doc["body"])
+
+            docs_to_index.append(ts_doc)
+            batch_ts.append(doc["updated"])
+
+            if len(docs_to_index) >= 500:
+                # a failed request raises, so the checkpoint only covers
+                # batches Typesense actually received
+                index_batch(ts_http, docs_to_index, texts)
+                indexed = True
+                new_last_ts = batch_ts[-1]
+                docs_to_index = []
+                texts = []
+                batch_ts = []
+
+        if docs_to_index:
+            index_batch(ts_http, docs_to_index, texts)
+            indexed = True
+            new_last_ts = batch_ts[-1]
 
     if new_last_ts and new_last_ts != last_ts:
         save_last_indexed(new_last_ts)
 
+    if indexed:
+        await invalidate_search_cache()
+
 
 if __name__ == "__main__":
     try:
@@ -129,7 +209,7 @@ if __name__ == "__main__":
 
 
 '''
-poetry add typesense
+poetry add typesense redis orjson httpx
 
 .env 
 MONGO_URI=mongodb://mongo:27017/news
@@ -139,6 +219,7 @@ TYPESENSE_PROTOCOL=http
 TYPESENSE_API_KEY=your_typesense_api_key_here
 LAST_INDEXED_FILE=.last_indexed
 INDEXER_INTERVAL=60
+REDIS_URL=redis://redis:6379/0
 
 docker-compose up -d indexer
 '''
\ No newline at end of file
@@ -0,0 +1,4 @@
+# Shared constants for messages on the raw pages queue
+
+# raw page messages published by crawler.fetch_async and consumed by crawler.store
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
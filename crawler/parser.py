@@ -1,19 +1,31 @@
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 
-from readability import Document
-from lxml import html
+import trafilatura
+from selectolax.parser import HTMLParser
 
-def _extract_meta(tree: html.HtmlElement, attr: str, value: str) -> Optional[str]:
-    el = tree.xpath(f"//meta[@{attr}='{value}']/@content")
-    return el[0].strip() if el else None
+def _extract_meta(tree: HTMLParser, attr: str, value: str) -> Optional[str]:
+    el = tree.css_first(f'meta[{attr}="{value}"]')
+    content = el.attributes.get("content") if el else None
+    return content.strip() if content else None
 
+_FALLBACK_FORMATS = ("%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d %H:%M:%S%z",
+                     "%Y/%m/%d %H:%M:%S", "%Y/%m/%d")
+
+@lru_cache(maxsize=4096)
 def _parse_datetime(dt_str: str) -> Optional[datetime]:
-    for fmt in ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S%z",
-                "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+    dt_str = dt_str.strip()
+    # fast path: fromisoformat covers the common ISO 8601 variants, including
+    # the basic format; a trailing Z is read as naive UTC
+    try:
+        return datetime.fromisoformat(dt_str.removesuffix("Z"))
+    except ValueError:
+        pass
+    for fmt in _FALLBACK_FORMATS:
         try:
-            return datetime.fromisoformat(dt_str) if "T" in dt_str else datetime.strptime(dt_str, fmt)
-        except Exception:
+            return datetime.strptime(dt_str, fmt)
+        except ValueError:
             continue
     return None
 
@@ -31,17 +43,23 @@ def parse_html(raw_html: str, url: str) -> dict:
       - author      (str or None)
       - published_at (ISO8601 string or None)
     """
-    # 1. Extract clean content + title
-    doc = Document(raw_html)
-    body_html = doc.summary()
-    title = doc.title().strip()
+    # 1. Extract clean main content
+    body_html = trafilatura.extract(
+        raw_html,
+        include_comments=False,
+        include_tables=False,
+        output_format="html",
+    ) or ""
 
-    # 2. Build an lxml tree for metadata
-    tree = html.fromstring(raw_html)
+    # 2. Build a selectolax tree for title + metadata
+    tree = HTMLParser(raw_html)
+    title_el = tree.css_first("title")
+    title = title_el.text(strip=True) if title_el else ""
 
     # 3. Canonical URL
-    canon = tree.xpath("//link[@rel='canonical']/@href")
-    canonical_url = canon[0].strip() if canon else url
+    canon = tree.css_first("link[rel=canonical]")
+    href = canon.attributes.get("href") if canon else None
+    canonical_url = href.strip() if href else url
 
     # 4. Author
     author = (
@@ -76,5 +94,5 @@ def parse_html(raw_html: str, url: str) -> dict:
 
 '''
 Example usage:
-poetry add readability-lxml lxml
+poetry add selectolax trafilatura
 '''
\ No newline at end of file
@@ -6,11 +6,13 @@ from pathlib import Path
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 
+from crawler.db import apply_pragmas
 from crawler.seed import load_seeds
 
 DB_PATH = Path("raw_pages.db")
 
 def init_db(conn):
+    apply_pragmas(conn)
     conn.execute("""
     CREATE TABLE IF NOT EXISTS raw_pages (
         url TEXT PRIMARY KEY,
@@ -18,6 +20,7 @@ def init_db(conn):
         fetched_time TEXT NOT NULL
     )
     """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_fetched ON raw_pages(fetched_time)")
     conn.commit()
 
 def fetch_url(url: str, ua: str = "news-crawler/0.1") -> str:
@@ -0,0 +1,28 @@
+# File: gunicorn.conf.py
+import os
+import shutil
+import multiprocessing
+
+from prometheus_client import multiprocess
+
+bind = f"{os.getenv('FASTAPI_HOST', '0.0.0.0')}:{os.getenv('FASTAPI_PORT', '8000')}"
+workers = int(os.getenv("API_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# one inference thread per worker so N workers don't oversubscribe the cores;
+# workers inherit this environment from the master
+os.environ.setdefault("EMBED_NUM_THREADS", "1")
+
+PROM_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+
+def on_starting(server):
+    # metric files left by a previous run would otherwise be aggregated too
+    if PROM_DIR:
+        shutil.rmtree(PROM_DIR, ignore_errors=True)
+        os.makedirs(PROM_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if PROM_DIR:
+        multiprocess.mark_process_dead(worker.pid)